@@ -0,0 +1,130 @@
+"""
+check_indicators.py
+
+Comprueba que el SetupTracker incremental da lo mismo que el cálculo completo
+con pandas (compute_volatility / classify_setup), barra a barra.
+
+Se generan series sintéticas (random walk con tramos alcistas para que haya
+breakouts, y un pico aislado para que el máximo salga de la ventana de ~6
+meses en un momento conocido) y en cada sesión se actualiza varias veces la barra en curso,
+como hace IBKR con keepUpToDate. En cada actualización se compara el tracker
+con el cálculo completo sobre los últimos ~6 meses de cierres.
+
+Si algo no cuadra, lo imprime y sale con código 1.
+Requiere pandas.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Añadimos la raíz del proyecto al sys.path para que 'src' se pueda importar
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.indicators import (
+    HISTORY_WINDOW,
+    SetupTracker,
+    classify_setup,
+    compute_volatility,
+)
+
+NUM_SERIES = 5
+NUM_BARS = 400
+SEED_BARS = 70
+TICKS_PER_BAR = 3
+VOL_TOLERANCE = 1e-9
+
+
+def make_closes(rng: random.Random, n: int):
+    closes = [100.0]
+    drift = 0.0
+    for i in range(n - 1):
+        if i % 60 == 0:
+            drift = rng.choice([-0.002, 0.0, 0.004])  # tramos bajistas / laterales / alcistas
+        closes.append(closes[-1] * (1 + rng.gauss(drift, 0.02)))
+    return closes
+
+
+def make_spike_closes(n: int, spike_at: int):
+    """
+    Subida constante del 1,5% por sesión (cada cierre es breakout) con un pico
+    aislado que bloquea el breakout mientras está en la ventana: el cambio de
+    setup marca exactamente cuándo sale de ella.
+    """
+    closes = [100.0 * 1.015 ** i for i in range(n)]
+    closes[spike_at] *= 10
+    return closes
+
+
+def full_recompute(closes):
+    hist = pd.DataFrame({"Close": closes[-HISTORY_WINDOW:]})
+    return compute_volatility(hist), classify_setup(hist)
+
+
+def check_series(rng: random.Random, series_id: int) -> dict:
+    if series_id % 2:
+        closes = make_spike_closes(NUM_BARS, SEED_BARS + 20)
+    else:
+        closes = make_closes(rng, NUM_BARS)
+    tracker = SetupTracker(f"S{series_id}")
+    tracker.seed(closes[:SEED_BARS])
+
+    result = {"checks": 0, "errors": 0, "setups": {}}
+    closed = list(closes[:SEED_BARS])
+
+    def compare(window, label: str) -> None:
+        vol, setup = full_recompute(window)
+        result["checks"] += 1
+        result["setups"][setup] = result["setups"].get(setup, 0) + 1
+
+        vol_ok = (vol is None and tracker.volatility is None) or (
+            vol is not None and tracker.volatility is not None
+            and abs(vol - tracker.volatility) <= VOL_TOLERANCE
+        )
+        if not vol_ok or setup != tracker.setup:
+            result["errors"] += 1
+            print(f"[ERROR] S{series_id} {label}: pandas=({vol}, {setup}) "
+                  f"tracker=({tracker.volatility}, {tracker.setup})")
+
+    compare(closed, "seed")
+
+    for i, close in enumerate(closes[SEED_BARS:], start=SEED_BARS):
+        # Barra nueva + varias actualizaciones de la barra en curso
+        for tick in range(TICKS_PER_BAR):
+            price = close * (1 + rng.uniform(-0.01, 0.01)) if tick < TICKS_PER_BAR - 1 else close
+            tracker.update(price, new_bar=(tick == 0))
+            compare(closed + [price], f"barra {i} tick {tick}")
+        closed.append(close)
+
+    return result
+
+
+def main():
+    rng = random.Random(42)
+    total_checks = 0
+    total_errors = 0
+    setups = {}
+
+    for series_id in range(NUM_SERIES):
+        result = check_series(rng, series_id)
+        total_checks += result["checks"]
+        total_errors += result["errors"]
+        for setup, count in result["setups"].items():
+            setups[setup] = setups.get(setup, 0) + count
+
+    print(f"Comprobaciones: {total_checks}, errores: {total_errors}")
+    print("Setups vistos:", ", ".join(f"{k}={v}" for k, v in sorted(setups.items())))
+
+    if "breakout" not in setups:
+        print("[ERROR] Ninguna serie ha generado un breakout: la comprobación no lo cubre.")
+        total_errors += 1
+
+    sys.exit(1 if total_errors else 0)
+
+
+if __name__ == "__main__":
+    main()
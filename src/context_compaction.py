@@ -0,0 +1,311 @@
+"""
+context_compaction.py
+
+Compactación del contexto que TradingAgents pasa a los agentes posteriores
+(researchers, trader, debate de riesgo, jueces).
+
+Sobre el estado del grafo, y solo en los campos que cada agente mete en su
+prompt (NODE_READS):
+- Deduplica párrafos repetidos entre los informes de los analistas
+  (en los logs grabados actuales no hay repetidos: no quita nada).
+- Recorta cada informe a un máximo de caracteres conservando siempre la
+  conclusión (última tabla de puntos clave y lo que la sigue); lo que se
+  recorta es la parte central.
+- En los historiales de debate deja completos los últimos turnos y resume
+  los anteriores de forma extractiva (primeras frases de cada turno).
+
+La compactación solo afecta a lo que ve el agente en su prompt: con
+restore_debate_histories() lo que devuelve el nodo se vuelve a montar sobre
+el estado original, así que el estado final y los logs quedan completos.
+
+No hace llamadas extra al LLM: el objetivo es bajar latencia, no añadirla.
+También da métricas de tokens antes / después (estimación ~4 caracteres
+por token, suficiente para comparar).
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_COMPACTION = {
+    "dedupe": True,            # quitar párrafos repetidos entre informes
+    "max_report_chars": 3000,  # por informe de analista (0 = sin límite)
+    "keep_last_turns": 2,      # turnos de debate que se pasan completos
+    "old_turn_chars": 600,     # resto de turnos: resumen de ~N caracteres
+}
+
+REPORT_FIELDS = (
+    "market_report",
+    "sentiment_report",
+    "news_report",
+    "fundamentals_report",
+)
+
+DEBATE_FIELDS = {
+    "investment_debate_state": ("history", "bull_history", "bear_history"),
+    "risk_debate_state": ("history", "risky_history", "safe_history", "neutral_history"),
+}
+
+# Campos que cada agente posterior mete en su prompt (TradingAgents). Los
+# informes que los jueces y el trader usan solo para buscar en memoria no
+# cuentan: compactarlos no ahorra tokens y cambiaría la búsqueda.
+# Un str es un campo de primer nivel; una tupla, (estado_debate, clave).
+_INVEST_HISTORY = ("investment_debate_state", "history")
+_RISK_HISTORY = ("risk_debate_state", "history")
+
+NODE_READS = {
+    "bull_researcher": REPORT_FIELDS + (_INVEST_HISTORY,),
+    "bear_researcher": REPORT_FIELDS + (_INVEST_HISTORY,),
+    "research_manager": (_INVEST_HISTORY,),
+    "risky_debator": REPORT_FIELDS + (_RISK_HISTORY,),
+    "safe_debator": REPORT_FIELDS + (_RISK_HISTORY,),
+    "neutral_debator": REPORT_FIELDS + (_RISK_HISTORY,),
+    "risk_manager": (_RISK_HISTORY,),
+}
+
+ALL_FIELDS = REPORT_FIELDS + tuple(
+    (debate_field, key)
+    for debate_field, keys in DEBATE_FIELDS.items()
+    for key in keys
+)
+
+TRUNCATED_MARKER = " [...]"
+MIN_DEDUPE_CHARS = 80      # títulos y líneas cortas no se deduplican
+MIN_CUT_CHARS = 200        # por debajo de esto no merece la pena meter medio párrafo
+
+_SPEAKER_RE = re.compile(
+    r"^(?=(?:Bull|Bear|Risky|Safe|Neutral) Analyst:)", re.MULTILINE
+)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)")
+
+
+def estimate_tokens(chars: int) -> int:
+    """Estimación grosera de tokens a partir de nº de caracteres (~4 por token)."""
+    return (chars + 3) // 4
+
+
+def _normalize(paragraph: str) -> str:
+    return " ".join(paragraph.lower().split())
+
+
+def _cut(text: str, max_chars: int) -> str:
+    """Recorta a max_chars, preferiblemente al final de una frase."""
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars]
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(head)]
+    if ends and ends[-1] > max_chars // 2:
+        head = head[:ends[-1]]
+    return head.rstrip() + TRUNCATED_MARKER
+
+
+def _is_heading(paragraph: str) -> bool:
+    text = paragraph.strip()
+    return text.startswith("#") or (len(text) < 100 and text.endswith(":"))
+
+
+def _conclusion_start(paragraphs: List[str]) -> int:
+    """
+    Índice donde empieza la conclusión del informe: la última tabla Markdown
+    (con su título, si lo tiene) y todo lo que la sigue. Sin tabla, el último
+    párrafo.
+    """
+    tables = [i for i, p in enumerate(paragraphs) if p.lstrip().startswith("|")]
+    if not tables:
+        return len(paragraphs) - 1
+    start = tables[-1]
+    if start > 0 and _is_heading(paragraphs[start - 1]):
+        start -= 1
+    return start
+
+
+def _cut_lines(text: str, max_chars: int) -> str:
+    """Recorta por líneas enteras (tablas Markdown) y marca el corte."""
+    marker = TRUNCATED_MARKER.strip()
+    kept: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        if size + len(line) + 1 > max_chars - len(marker) - 1:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept + [marker])
+
+
+def _shrink_conclusion(paragraphs: List[str], max_chars: int) -> str:
+    """
+    La conclusión no cabe entera: se conserva lo que va después de la tabla
+    (valoración final, propuesta) y se recorta la tabla por filas.
+    """
+    tables = [i for i, p in enumerate(paragraphs) if p.lstrip().startswith("|")]
+    cut_chars = max_chars - len(TRUNCATED_MARKER)
+    if not tables:
+        return _cut("\n\n".join(paragraphs), cut_chars)
+
+    table_at = tables[0]
+    before = paragraphs[:table_at]
+    after = paragraphs[table_at + 1:]
+    fixed = "\n\n".join(before + after)
+    room = max_chars - len(fixed) - 4
+    if room < MIN_CUT_CHARS:
+        return _cut("\n\n".join(after) or fixed, cut_chars)
+
+    table = _cut_lines(paragraphs[table_at], room)
+    return "\n\n".join(before + [table] + after)
+
+
+def compact_report(text: str, max_chars: int, seen: Optional[set] = None) -> str:
+    """
+    Quita párrafos ya vistos (si se pasa 'seen') y, si el informe pasa de
+    max_chars, recorta la parte central: se conserva el principio hasta
+    agotar el presupuesto (cortando el último párrafo si hace falta) y
+    siempre la conclusión.
+    """
+    if not text:
+        return text
+
+    paragraphs: List[str] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        if seen is not None and len(paragraph.strip()) >= MIN_DEDUPE_CHARS:
+            key = _normalize(paragraph)
+            if key in seen:
+                continue
+            seen.add(key)
+        paragraphs.append(paragraph)
+
+    joined = "\n\n".join(paragraphs)
+    if not max_chars or len(joined) <= max_chars:
+        return joined
+
+    start = _conclusion_start(paragraphs)
+    conclusion = "\n\n".join(paragraphs[start:])
+    marker = TRUNCATED_MARKER.strip()
+    if len(conclusion) + len(marker) + 2 >= max_chars:
+        # La conclusión sola ya llena el presupuesto
+        return _shrink_conclusion(paragraphs[start:], max_chars)
+
+    budget = max_chars - len(conclusion) - len(marker) - 4
+    head: List[str] = []
+    size = 0
+    for paragraph in paragraphs[:start]:
+        remaining = budget - size
+        if len(paragraph) <= remaining:
+            head.append(paragraph)
+            size += len(paragraph) + 2
+            continue
+        if remaining >= MIN_CUT_CHARS:
+            head.append(_cut(paragraph, remaining - len(TRUNCATED_MARKER)))
+        break
+
+    return "\n\n".join(head + [marker, conclusion])
+
+
+def split_turns(history: str) -> List[str]:
+    """Separa un historial de debate en turnos ('Bull Analyst: ...', etc.)."""
+    return [t.strip() for t in _SPEAKER_RE.split(history or "") if t.strip()]
+
+
+def compact_history(history: str, keep_last_turns: int, old_turn_chars: int) -> str:
+    """
+    Deja completos los últimos 'keep_last_turns' turnos del debate y
+    resume los anteriores a ~old_turn_chars caracteres cada uno.
+    """
+    if not history:
+        return history
+
+    turns = split_turns(history)
+    if len(turns) <= keep_last_turns:
+        return history
+
+    split_at = len(turns) - keep_last_turns
+    old = [_cut(t, old_turn_chars) for t in turns[:split_at]]
+    recent = turns[split_at:]
+
+    prefix = "\n" if history.startswith("\n") else ""
+    return prefix + "\n".join(old + recent)
+
+
+def _get_field(state: Dict, path) -> str:
+    if isinstance(path, tuple):
+        debate_field, key = path
+        return (state.get(debate_field) or {}).get(key) or ""
+    return state.get(path) or ""
+
+
+def _context_chars(state: Dict, reads) -> int:
+    return sum(len(_get_field(state, path)) for path in reads)
+
+
+def compact_state(
+    state: Dict,
+    settings: Optional[Dict] = None,
+    reads=None,
+) -> Tuple[Dict, Dict]:
+    """
+    Devuelve (estado compactado, métricas). No modifica el estado original.
+
+    reads: campos a compactar (p.ej. NODE_READS["bull_researcher"]); por
+    defecto todos. Las métricas (chars_before, chars_after, tokens_before,
+    tokens_after) se calculan solo sobre esos campos.
+    """
+    cfg = {**DEFAULT_COMPACTION, **(settings or {})}
+    reads = ALL_FIELDS if reads is None else reads
+    compacted = dict(state)
+
+    seen = set() if cfg["dedupe"] else None
+    for field in REPORT_FIELDS:
+        if field in reads and state.get(field):
+            compacted[field] = compact_report(state[field], cfg["max_report_chars"], seen)
+
+    for debate_field, keys in DEBATE_FIELDS.items():
+        debate = state.get(debate_field)
+        if not debate:
+            continue
+        debate = dict(debate)
+        for key in keys:
+            if (debate_field, key) in reads and debate.get(key):
+                debate[key] = compact_history(
+                    debate[key], cfg["keep_last_turns"], cfg["old_turn_chars"]
+                )
+        compacted[debate_field] = debate
+
+    chars_before = _context_chars(state, reads)
+    chars_after = _context_chars(compacted, reads)
+    stats = {
+        "chars_before": chars_before,
+        "chars_after": chars_after,
+        "tokens_before": estimate_tokens(chars_before),
+        "tokens_after": estimate_tokens(chars_after),
+    }
+    return compacted, stats
+
+
+def restore_debate_histories(result: Dict, original: Dict, compacted: Dict) -> Dict:
+    """
+    Los debatientes devuelven history = history_recibido + nuevo argumento.
+    Como recibieron el history compactado, aquí se toma solo lo añadido y se
+    pega al history original, para no guardar el debate recortado en el estado.
+    Los jueces devuelven el history tal cual (no añaden nada) -> queda el original.
+    """
+    if not isinstance(result, dict):
+        return result
+
+    restored = dict(result)
+    for debate_field, keys in DEBATE_FIELDS.items():
+        new_debate = result.get(debate_field)
+        if not new_debate:
+            continue
+        original_debate = original.get(debate_field) or {}
+        compacted_debate = compacted.get(debate_field) or {}
+
+        new_debate = dict(new_debate)
+        for key in keys:
+            value = new_debate.get(key)
+            seen_by_node = compacted_debate.get(key) or ""
+            if value is None or not value.startswith(seen_by_node):
+                continue
+            appended = value[len(seen_by_node):]
+            new_debate[key] = (original_debate.get(key) or "") + appended
+        restored[debate_field] = new_debate
+
+    return restored
@@ -9,7 +9,9 @@ Funciones principales:
 - Leer equity de la cuenta.
 - Leer posiciones (todas o de un símbolo).
 - Obtener último precio de un símbolo.
+- Streaming de barras diarias (keepUpToDate) hacia un SetupTracker.
 - Enviar órdenes de mercado.
+- Reconciliar órdenes ya enviadas (por orderRef) tras un reinicio.
 """
 
 import os
@@ -18,6 +20,8 @@ from typing import List, Dict, Optional
 from dotenv import load_dotenv
 from ib_insync import IB, Stock, MarketOrder
 
+from src.indicators import SetupTracker
+
 
 load_dotenv()
 
@@ -206,13 +210,62 @@ class IBKRClient:
             print(f"[WARN] Error obteniendo precio IBKR para {symbol}: {e}")
             return None
 
+    def stream_daily_bars(self, symbol: str, tracker: SetupTracker):
+        """
+        Pide ~6 meses de barras diarias con keepUpToDate=True: IBKR va
+        actualizando la barra de hoy en tiempo real y añade una nueva al
+        abrir la siguiente sesión.
+
+        El histórico inicial se carga en el tracker una sola vez; después
+        cada actualización cuesta O(1). Devuelve el BarDataList para poder
+        cancelarlo con stop_bar_stream().
+        """
+        if not self.ib.isConnected():
+            raise RuntimeError("IBKR no está conectado.")
+
+        contract = self._make_stock_contract(symbol)
+        bars = self.ib.reqHistoricalData(
+            contract,
+            endDateTime="",
+            durationStr="6 M",
+            barSizeSetting="1 day",
+            whatToShow="TRADES",
+            useRTH=True,
+            keepUpToDate=True,
+        )
+        tracker.seed(bar.close for bar in bars)
+
+        def on_bar_update(bars, has_new_bar: bool) -> None:
+            if not bars:
+                return
+            if has_new_bar and len(bars) >= 2:
+                # Cierre definitivo de la barra anterior y arranque de la nueva
+                tracker.update(bars[-2].close, new_bar=False)
+                tracker.update(bars[-1].close, new_bar=True)
+            else:
+                tracker.update(bars[-1].close, new_bar=False)
+
+        bars.updateEvent += on_bar_update
+        return bars
+
+    def stop_bar_stream(self, bars) -> None:
+        if self.ib.isConnected():
+            self.ib.cancelHistoricalData(bars)
 
     # ------------------------
     # Órdenes
     # ------------------------
-    def send_market_order(self, symbol: str, side: str, quantity: int):
+    def send_market_order(
+        self,
+        symbol: str,
+        side: str,
+        quantity: int,
+        order_ref: Optional[str] = None,
+    ):
         """
         Envía una orden de mercado BUY/SELL para 'quantity' acciones del símbolo dado.
+        Si se pasa 'order_ref', se guarda en la orden para poder encontrarla
+        después con find_order_by_ref().
         """
         if not self.ib.isConnected():
             raise RuntimeError("IBKR no está conectado.")
@@ -227,6 +280,8 @@ class IBKRClient:
 
         contract = self._make_stock_contract(symbol)
         order = MarketOrder(side, quantity)
+        if order_ref:
+            order.orderRef = order_ref
 
         print(f"Enviando orden {side} {quantity}x {symbol} (Market)...")
         trade = self.ib.placeOrder(contract, order)
@@ -236,3 +291,43 @@ class IBKRClient:
 
         print(f"Orden enviada. Estado actual: {trade.orderStatus.status}")
         return trade
+
+    def find_order_by_ref(self, order_ref: str) -> Optional[Dict]:
+        """
+        Busca en IBKR una orden enviada con el orderRef dado.
+        Mira primero las órdenes abiertas y luego las ejecuciones del día.
+
+        Devuelve un dict con: order_id, status, filled_qty, avg_price.
+        Si IBKR no conoce la orden, devuelve None.
+        """
+        if not self.ib.isConnected():
+            raise RuntimeError("IBKR no está conectado.")
+
+        # 1) Órdenes vivas (enviadas y aún no terminadas)
+        for trade in self.ib.openTrades():
+            if trade.order.orderRef == order_ref:
+                return {
+                    "order_id": trade.order.orderId,
+                    "status": trade.orderStatus.status,
+                    "filled_qty": float(trade.orderStatus.filled),
+                    "avg_price": float(trade.orderStatus.avgFillPrice),
+                }
+
+        # 2) Ejecuciones del día (órdenes ya llenadas)
+        fills = [
+            f for f in self.ib.reqExecutions()
+            if f.execution.orderRef == order_ref
+        ]
+        if not fills:
+            return None
+
+        filled_qty = sum(float(f.execution.shares) for f in fills)
+        notional = sum(float(f.execution.shares) * float(f.execution.price) for f in fills)
+        avg_price = notional / filled_qty if filled_qty > 0 else 0.0
+
+        return {
+            "order_id": fills[-1].execution.orderId,
+            "status": "Filled",
+            "filled_qty": filled_qty,
+            "avg_price": avg_price,
+        }
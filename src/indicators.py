@@ -0,0 +1,292 @@
+"""
+indicators.py
+
+Indicadores incrementales para detectar setups intradía sin recalcular
+todo el histórico en cada barra.
+
+- RollingStats: media / desviación típica en ventana deslizante (Welford).
+- RollingMax:   máximo en ventana deslizante (deque monótona).
+- SetupTracker: volatilidad anual, MA50 y máximo previo de un símbolo,
+  alimentado barra a barra. Emite un evento cuando cambia el setup
+  ('breakout', 'trend_change', 'other').
+
+También están aquí las versiones de cálculo completo sobre un DataFrame de
+histórico (compute_volatility, classify_setup) que usa el orquestador. Ambas
+comparten las reglas de classify_levels; check_indicators.py comprueba
+barra a barra que dan el mismo resultado.
+
+Todas las actualizaciones son O(1) (RollingMax amortizado).
+"""
+
+from collections import deque
+from math import sqrt
+from typing import Callable, Iterable, Optional
+
+TRADING_DAYS = 252
+HISTORY_WINDOW = 126       # ~6 meses de sesiones, igual que el histórico de yfinance
+MA_WINDOW = 50
+MIN_BARS_VOLATILITY = 20
+MIN_BARS_SETUP = 60
+BREAKOUT_MARGIN = 1.01     # cierre > 1% por encima del máximo previo
+
+
+def classify_levels(last_close: float, prior_max: float, ma50: float) -> str:
+    """
+    Reglas de setup a partir de los niveles ya calculados:
+    - 'breakout': último cierre rompe el máximo previo en más de un 1%.
+    - 'trend_change': por encima de MA50 pero sin romper máximos.
+    - 'other': resto.
+    """
+    if last_close >= prior_max * BREAKOUT_MARGIN:
+        return "breakout"
+    if last_close > ma50:
+        return "trend_change"
+    return "other"
+
+
+def compute_volatility(hist) -> Optional[float]:
+    """
+    Calcula una volatilidad anualizada aproximada a partir de retornos diarios.
+    Devuelve un valor en tanto por uno (0.3 = 30% anual).
+    """
+    if hist is None or len(hist) < MIN_BARS_VOLATILITY:
+        return None
+    try:
+        returns = hist["Close"].pct_change().dropna()
+        vol_annual = returns.std() * (TRADING_DAYS ** 0.5)
+        return float(vol_annual)
+    except Exception as e:
+        print(f"[WARN] Error calculando volatilidad: {e}")
+        return None
+
+
+def classify_setup(hist) -> str:
+    """
+    Clasifica el tipo de setup para el símbolo dado (cálculo completo sobre
+    el histórico; para seguimiento intradía ver SetupTracker):
+    - 'breakout': último cierre rompe máximos recientes.
+    - 'trend_change': por encima de MA50 pero no rompe máximos.
+    - 'other': resto.
+    """
+    if hist is None or len(hist) < MIN_BARS_SETUP:
+        return "other"
+
+    closes = hist["Close"]
+    last_close = closes.iloc[-1]
+
+    # Máximo anterior de los últimos ~6 meses (sin el último cierre,
+    # si no el breakout nunca se cumpliría)
+    recent_max = closes.iloc[:-1].max()
+
+    # Media móvil 50
+    ma50 = closes.rolling(window=MA_WINDOW).mean().iloc[-1]
+
+    return classify_levels(last_close, recent_max, ma50)
+
+
+class RollingStats:
+    """
+    Media y varianza muestral (ddof=1, como pandas) en una ventana
+    deslizante, con el algoritmo de Welford para añadir / quitar valores.
+
+    Quitar valores grandes (p.ej. un gap) deja error de redondeo acumulado
+    en la varianza, así que cada 'window' inserciones se recalcula exacta
+    desde la ventana: sigue siendo O(1) amortizado.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._values = deque()
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._pushes_since_resync = 0
+
+    def push(self, x: float) -> None:
+        if self.n == self.window:
+            self._remove(self._values.popleft())
+        self._values.append(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= self.window:
+            self._resync()
+
+    def _resync(self) -> None:
+        """Recalcula media y M2 desde los valores de la ventana (dos pasadas)."""
+        self._pushes_since_resync = 0
+        if not self._values:
+            return
+        self.mean = sum(self._values) / self.n
+        self._m2 = sum((v - self.mean) ** 2 for v in self._values)
+
+    def _remove(self, x: float) -> None:
+        self.n -= 1
+        if self.n == 0:
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.n
+        self._m2 = max(0.0, self._m2 - delta * (x - self.mean))
+
+    def std(self) -> Optional[float]:
+        if self.n < 2:
+            return None
+        return sqrt(self._m2 / (self.n - 1))
+
+    def std_with(self, x: float) -> Optional[float]:
+        """
+        Desviación típica si se añadiera 'x' a la ventana, sin modificarla.
+        Sirve para incluir la barra en curso, que aún puede cambiar.
+        """
+        n = self.n + 1
+        delta = x - self.mean
+        mean = self.mean + delta / n
+        m2 = self._m2 + delta * (x - mean)
+        if n < 2:
+            return None
+        return sqrt(m2 / (n - 1))
+
+
+class RollingMax:
+    """Máximo en ventana deslizante con una deque monótona decreciente."""
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._items = deque()  # (índice, valor), valores decrecientes
+        self._index = 0
+
+    def push(self, x: float) -> None:
+        while self._items and self._items[-1][1] <= x:
+            self._items.pop()
+        self._items.append((self._index, x))
+        if self._items[0][0] <= self._index - self.window:
+            self._items.popleft()
+        self._index += 1
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._items[0][1] if self._items else None
+
+
+class SetupTracker:
+    """
+    Indicadores de un símbolo sobre barras diarias, actualizados barra a barra.
+
+    Se distingue entre barras cerradas y la barra en curso (la de hoy, que
+    IBKR va actualizando con keepUpToDate): las cerradas entran en las
+    ventanas; la barra en curso solo se combina al evaluar, así que puede
+    cambiar tantas veces como haga falta sin coste extra.
+
+    on_setup_change(symbol, setup_anterior, setup_nuevo, tracker) se llama
+    cada vez que cambia el setup (no durante seed()).
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        history_window: int = HISTORY_WINDOW,
+        ma_window: int = MA_WINDOW,
+        on_setup_change: Optional[Callable[[str, str, str, "SetupTracker"], None]] = None,
+    ) -> None:
+        self.symbol = symbol
+        self.history_window = history_window
+        self.ma_window = ma_window
+        self.on_setup_change = on_setup_change
+
+        # Ventanas sobre barras cerradas (la barra en curso completa la ventana)
+        self._returns = RollingStats(history_window - 2)
+        self._ma_closes = deque(maxlen=ma_window - 1)
+        self._ma_sum = 0.0
+        self._prior_max = RollingMax(history_window - 1)
+        self._closed_count = 0
+        self._last_closed: Optional[float] = None
+
+        self.last_close: Optional[float] = None
+        self.setup = "other"
+
+    # ------------------------
+    # Alimentación
+    # ------------------------
+    def seed(self, closes: Iterable[float]) -> str:
+        """
+        Carga el histórico inicial (la última barra se trata como barra en curso)
+        sin emitir eventos. Devuelve el setup resultante.
+        """
+        for close in closes:
+            self._advance(float(close), new_bar=True)
+        self.setup = self._evaluate()
+        return self.setup
+
+    def update(self, close: float, new_bar: bool = False) -> str:
+        """
+        Actualiza con el cierre de la barra en curso.
+        new_bar=True indica que la barra anterior ya está cerrada y 'close'
+        pertenece a una barra nueva.
+        """
+        self._advance(float(close), new_bar=new_bar)
+
+        setup = self._evaluate()
+        if setup != self.setup:
+            previous = self.setup
+            self.setup = setup
+            if self.on_setup_change is not None:
+                self.on_setup_change(self.symbol, previous, setup, self)
+        return setup
+
+    def _advance(self, close: float, new_bar: bool) -> None:
+        if new_bar and self.last_close is not None:
+            self._close_bar(self.last_close)
+        self.last_close = close
+
+    def _close_bar(self, close: float) -> None:
+        if self._last_closed is not None:
+            self._returns.push(close / self._last_closed - 1)
+
+        if len(self._ma_closes) == self._ma_closes.maxlen:
+            self._ma_sum -= self._ma_closes[0]
+        self._ma_closes.append(close)
+        self._ma_sum += close
+
+        self._prior_max.push(close)
+        self._closed_count += 1
+        self._last_closed = close
+
+    # ------------------------
+    # Indicadores (incluyen la barra en curso)
+    # ------------------------
+    @property
+    def num_bars(self) -> int:
+        if self.last_close is None:
+            return 0
+        return min(self._closed_count, self.history_window - 1) + 1
+
+    @property
+    def prior_max(self) -> Optional[float]:
+        """Máximo de los cierres anteriores a la barra en curso."""
+        return self._prior_max.max
+
+    @property
+    def ma(self) -> Optional[float]:
+        if self.last_close is None or len(self._ma_closes) < self.ma_window - 1:
+            return None
+        return (self._ma_sum + self.last_close) / self.ma_window
+
+    @property
+    def volatility(self) -> Optional[float]:
+        """Volatilidad anualizada (tanto por uno), como compute_volatility()."""
+        if self.num_bars < MIN_BARS_VOLATILITY or self._last_closed is None:
+            return None
+        std = self._returns.std_with(self.last_close / self._last_closed - 1)
+        if std is None:
+            return None
+        return std * sqrt(TRADING_DAYS)
+
+    def _evaluate(self) -> str:
+        if self.num_bars < MIN_BARS_SETUP:
+            return "other"
+        return classify_levels(self.last_close, self.prior_max, self.ma)
@@ -0,0 +1,62 @@
+"""
+monitor_setups.py
+
+Vigila intradía el setup de un universo de símbolos con barras de IBKR
+(keepUpToDate) e indicadores incrementales, sin volver a descargar ni
+recalcular el histórico. Avisa cada vez que un símbolo cambia de setup
+(p.ej. un nuevo 'breakout').
+
+Ctrl+C para parar.
+"""
+
+import sys
+from pathlib import Path
+
+# Añadimos la raíz del proyecto al sys.path para que 'src' se pueda importar
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.ibkr_client import IBKRClient
+from src.indicators import SetupTracker
+from src.check_ibkr_symbols import CANDIDATE_SYMBOLS
+
+
+def print_setup_change(symbol: str, previous: str, setup: str, tracker: SetupTracker) -> None:
+    vol = tracker.volatility
+    vol_txt = f"{vol * 100:.1f}%" if vol is not None else "n/d"
+    print(
+        f"[SETUP] {symbol}: {previous} -> {setup} | "
+        f"cierre {tracker.last_close:.2f}, máx. previo {tracker.prior_max:.2f}, "
+        f"MA50 {tracker.ma:.2f}, vol {vol_txt}"
+    )
+
+
+def main():
+    ib = IBKRClient()
+    ib.connect()
+
+    streams = []
+    for sym in CANDIDATE_SYMBOLS:
+        tracker = SetupTracker(sym, on_setup_change=print_setup_change)
+        try:
+            bars = ib.stream_daily_bars(sym, tracker)
+        except Exception as e:
+            print(f"[WARN] No se pudo suscribir a barras de {sym}: {e}")
+            continue
+        streams.append(bars)
+        print(f"{sym}: setup inicial {tracker.setup} ({tracker.num_bars} barras)")
+
+    print(f"\nVigilando {len(streams)} símbolos. Ctrl+C para salir.")
+    try:
+        ib.ib.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for bars in streams:
+            ib.stop_bar_stream(bars)
+        ib.disconnect()
+
+
+if __name__ == "__main__":
+    main()
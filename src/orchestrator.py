@@ -10,13 +10,17 @@ Gestor de cartera swing con:
 - Stops y tamaño ajustados según volatilidad y tipo de setup:
     * Breakout de máximos -> stop algo más ceñido -> más tamaño.
     * Cambio de tendencia / pullback -> stop base.
+
+Cada pasada se apunta en un diario (src/run_journal.py): si se cae a mitad,
+al relanzar retoma cada símbolo en la primera etapa pendiente y reconcilia
+las órdenes ya enviadas contra IBKR en lugar de reenviarlas.
 """
 
 from datetime import date as dt_date
 import sys
 from pathlib import Path
 from math import floor
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 
 import yfinance as yf  # asegúrate de tenerlo en el venv: pip install yfinance
 
@@ -28,6 +32,8 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from src.ta_client import TradingAgentsClient
 from src.ibkr_client import IBKRClient
+from src.run_journal import RunJournal
+from src.indicators import classify_setup, compute_volatility
 
 
 # Parámetros de cartera swing
@@ -39,6 +45,16 @@ MIN_MARKET_CAP = 2_000_000_000  # 2B
 
 EXECUTE_ORDERS = True        # True = manda órdenes en paper, False = solo simula
 
+# Compactación del contexto de TradingAgents (menos tokens / latencia por símbolo).
+# None = desactivada; {} = valores por defecto de src/context_compaction.py.
+CONTEXT_COMPACTION = None
+
+# Estados con los que IBKR ya ha aceptado la orden (no se reenvía nunca)
+ACKED_ORDER_STATUSES = ("PreSubmitted", "Submitted", "Filled")
+# Estados finales sin ejecución (rechazada / cancelada): el símbolo se da por
+# terminado con ese resultado, sin reenviar ni dejarlo pendiente.
+TERMINAL_ORDER_STATUSES = ("Inactive", "Cancelled", "ApiCancelled")
+
 SYMBOLS = [
     # Big Tech / growth grandes
     "AMZN",   # Amazon
@@ -88,52 +104,6 @@ def get_market_cap_and_history(symbol: str) -> Tuple[Optional[float], Optional["
     return mcap, hist
 
 
-def compute_volatility(hist) -> Optional[float]:
-    """
-    Calcula una volatilidad anualizada aproximada a partir de retornos diarios.
-    Devuelve un valor en tanto por uno (0.3 = 30% anual).
-    """
-    if hist is None or len(hist) < 20:
-        return None
-    try:
-        returns = hist["Close"].pct_change().dropna()
-        vol_annual = returns.std() * (252 ** 0.5)
-        return float(vol_annual)
-    except Exception as e:
-        print(f"[WARN] Error calculando volatilidad: {e}")
-        return None
-
-
-def classify_setup(hist) -> str:
-    """
-    Clasifica el tipo de setup para el símbolo dado:
-    - 'breakout': último cierre rompe máximos recientes.
-    - 'trend_change': por encima de MA50 pero no rompe máximos.
-    - 'other': resto.
-    """
-    if hist is None or len(hist) < 60:
-        return "other"
-
-    closes = hist["Close"]
-    last_close = closes.iloc[-1]
-
-    # Máximos últimos ~6 meses (o 252 sesiones si tuvieras)
-    recent_max = closes.max()
-
-    # Media móvil 50
-    ma50 = closes.rolling(window=50).mean().iloc[-1]
-
-    # Breakout: cierre más de 1% por encima del máximo anterior
-    if last_close >= recent_max * 1.01:
-        return "breakout"
-
-    # Cambio de tendencia / pullback: por encima de MA50 pero sin romper máximos
-    if last_close > ma50:
-        return "trend_change"
-
-    return "other"
-
-
 def choose_stop_pct(vol_annual: Optional[float], setup: str) -> float:
     """
     Elige un porcentaje de stop (en tanto por uno) según volatilidad y tipo de setup.
@@ -159,13 +129,312 @@ def choose_stop_pct(vol_annual: Optional[float], setup: str) -> float:
     return stop_pct
 
 
+# ------------------------ Sizing y órdenes ------------------------
+
+def compute_entry_size(symbol: str, ib_client: IBKRClient, equity: float) -> Optional[Dict]:
+    """
+    Calcula el tamaño de una entrada BUY según market cap, volatilidad, setup
+    y límites de exposición. Devuelve un dict con qty, precio, stop, etc.
+    o None si no se debe entrar.
+    """
+    # Datos fundamentales / técnicos: market cap, histórico, volatilidad, setup
+    market_cap, hist = get_market_cap_and_history(symbol)
+    if market_cap is None:
+        print("No puedo obtener market cap, no opero este símbolo.")
+        return None
+
+    print(f"Market cap {symbol}: {market_cap / 1e9:.2f} B")
+
+    if market_cap < MIN_MARKET_CAP:
+        print("Market cap < 2B, descartado por criterio de cartera swing.")
+        return None
+
+    vol_annual = compute_volatility(hist)
+    setup = classify_setup(hist)
+
+    print(f"Volatilidad anual aprox: {vol_annual * 100:.1f}%"
+          if vol_annual is not None else "No se pudo estimar volatilidad.")
+    print(f"Tipo de setup: {setup}")
+
+    stop_pct = choose_stop_pct(vol_annual, setup)
+    print(f"Stop porcentual estimado: {stop_pct * 100:.2f}%")
+
+    # Precio actual aproximado (por si los datos de IB están limitados)
+    last_price = ib_client.get_last_price_ibkr_only(symbol)
+
+    if last_price is None or last_price <= 0:
+        print("No tengo un precio válido para dimensionar, no opero.")
+        return None
+
+    # Riesgo y tamaño
+    risk_amount = equity * RISK_PER_TRADE        # € de riesgo por trade
+    risk_per_share = last_price * stop_pct       # € de riesgo por acción
+    qty = floor(risk_amount / risk_per_share)    # nº acciones
+
+    if qty <= 0:
+        print("Qty calculada <= 0, no opero.")
+        return None
+
+    capital_pos = qty * last_price
+    max_capital_for_symbol = equity * MAX_POSITION_EXPOSURE
+
+    if capital_pos > max_capital_for_symbol:
+        # Recortar tamaño para respetar el 8% de la cartera
+        qty_cap_limit = floor(max_capital_for_symbol / last_price)
+        print(f"Capital para posición ({capital_pos:.2f}) supera 8% cartera.")
+        print(f"Ajusto qty de {qty} -> {qty_cap_limit} para respetar el 8%.")
+        qty = qty_cap_limit
+
+    if qty <= 0:
+        print("Tras aplicar límite de exposición (8%), qty <= 0. No entro.")
+        return None
+
+    return {
+        "qty": qty,
+        "last_price": last_price,
+        "stop_pct": stop_pct,
+        "setup": setup,
+        "risk_amount": risk_amount,
+        "risk_per_share": risk_per_share,
+    }
+
+
+def record_fill(journal: RunJournal, symbol: str, qty: float, avg_price: float) -> None:
+    """
+    Apunta la ejecución acumulada del símbolo. Si ya había un fill parcial,
+    se vuelve a apuntar cuando crece la cantidad (la última entrada manda).
+    """
+    previous = journal.get(symbol, "fill")
+    if qty > 0 and (previous is None or qty > previous["qty"]):
+        journal.record(symbol, "fill", qty=float(qty), avg_price=float(avg_price))
+
+
+def is_fully_filled(journal: RunJournal, symbol: str) -> bool:
+    sent = journal.get(symbol, "order_sent")
+    fill = journal.get(symbol, "fill")
+    return sent is not None and fill is not None and fill["qty"] >= sent["qty"]
+
+
+def adjust_counters_for_order(
+    portfolio: Dict,
+    side: str,
+    symbol: str,
+    open_symbols: set,
+) -> None:
+    """
+    Ajusta nº de trades / riesgo por una orden viva de esta pasada que aún
+    no se refleja en las posiciones leídas al arrancar.
+    """
+    if side == "BUY" and symbol not in open_symbols:
+        portfolio["num_open_trades"] += 1
+        portfolio["risk_total"] += RISK_PER_TRADE * portfolio["equity"]
+    elif side == "SELL" and symbol in open_symbols:
+        portfolio["num_open_trades"] = max(0, portfolio["num_open_trades"] - 1)
+
+
+def submit_order_once(
+    ib_client: IBKRClient,
+    journal: RunJournal,
+    symbol: str,
+    side: str,
+    qty: int,
+) -> bool:
+    """
+    Envía la orden apuntándola antes en el diario (write-ahead) con un
+    orderRef determinista, para que un reinicio pueda reconciliarla.
+
+    Devuelve True si IBKR ha confirmado la orden (ACKED_ORDER_STATUSES) o la
+    ha rechazado (TERMINAL_ORDER_STATUSES): en ambos casos el símbolo termina.
+    La ejecución se apunta cuando llega el evento de fill de IBKR, o al
+    final de la pasada / en la reconciliación si aún no había llegado.
+    """
+    order_ref = journal.order_ref(symbol, side)
+    journal.record(symbol, "order_sent", side=side, qty=qty, order_ref=order_ref)
+
+    print(f"[EJECUTANDO] {side} {qty} {symbol}")
+    trade = ib_client.send_market_order(symbol, side, qty, order_ref=order_ref)
+    if trade is None:
+        return True
+
+    status = trade.orderStatus.status
+    if status in TERMINAL_ORDER_STATUSES:
+        print(f"[WARN] IBKR ha rechazado / cancelado la orden {order_ref} (estado={status}).")
+        journal.record(symbol, "order", order_id=trade.order.orderId, status=status)
+        return True
+
+    if status not in ACKED_ORDER_STATUSES:
+        print(f"[WARN] IBKR no ha confirmado la orden {order_ref} (estado={status}). "
+              f"Queda pendiente de reconciliar.")
+        return False
+
+    journal.record(symbol, "order", order_id=trade.order.orderId, status=status)
+
+    if trade.isDone():
+        record_fill(journal, symbol, trade.orderStatus.filled, trade.orderStatus.avgFillPrice)
+    else:
+        trade.filledEvent += lambda t: record_fill(
+            journal, symbol, t.orderStatus.filled, t.orderStatus.avgFillPrice
+        )
+    return True
+
+
+def record_pending_fills(ib_client: IBKRClient, journal: RunJournal, symbols) -> None:
+    """
+    Para las órdenes confirmadas de esta pasada que aún no tienen el fill
+    completo apuntado (sin fill o con fill parcial), consulta IBKR.
+    """
+    for symbol in symbols:
+        sent = journal.get(symbol, "order_sent")
+        order = journal.get(symbol, "order")
+        if sent is None or order is None or order["status"] in TERMINAL_ORDER_STATUSES:
+            continue
+        if is_fully_filled(journal, symbol):
+            continue
+        info = ib_client.find_order_by_ref(sent["order_ref"])
+        if info is not None:
+            record_fill(journal, symbol, info["filled_qty"], info["avg_price"])
+
+
+def reconcile_order(ib_client: IBKRClient, journal: RunJournal, symbol: str) -> Optional[Dict]:
+    """
+    Si el diario dice que ya se envió una orden para el símbolo, la busca en
+    IBKR (órdenes abiertas / ejecuciones) en lugar de reenviarla.
+    Devuelve la info de la orden (con 'side') o None si IBKR no la conoce.
+    """
+    sent = journal.get(symbol, "order_sent")
+    if sent is None:
+        return None
+
+    order_ref = sent["order_ref"]
+    info = ib_client.find_order_by_ref(order_ref)
+    if info is None:
+        print(f"[RESUME] La orden {order_ref} no aparece en IBKR, vuelvo a evaluar {symbol}.")
+        return None
+
+    print(f"[RESUME] Orden {order_ref} ya en IBKR (id={info['order_id']}, "
+          f"estado={info['status']}, ejecutadas={info['filled_qty']}). No la reenvío.")
+
+    journal.record(symbol, "order", order_id=info["order_id"], status=info["status"])
+    record_fill(journal, symbol, info["filled_qty"], info["avg_price"])
+
+    return {**info, "side": sent["side"]}
+
+
 # ------------------------ Orquestador principal ------------------------
 
+def process_symbol(
+    symbol: str,
+    today: str,
+    ta_client: TradingAgentsClient,
+    ib_client: IBKRClient,
+    journal: RunJournal,
+    portfolio: Dict,
+) -> bool:
+    """
+    Gestiona un símbolo: señal TA -> salida / entrada.
+    'portfolio' lleva equity, num_open_trades y risk_total y se actualiza in situ.
+    Las etapas ya registradas en el diario (señal, sizing) se reutilizan.
+
+    Devuelve False si se envió una orden que IBKR aún no ha confirmado:
+    el símbolo no se da por terminado y se reconcilia al relanzar.
+    """
+    equity = portfolio["equity"]
+
+    # 2) Señal de TradingAgents
+    decision = journal.get(symbol, "decision")
+    if decision is not None:
+        action = decision.get("action", "HOLD")
+        print(f"[RESUME] Señal TA ya registrada para {symbol}: {action}")
+    else:
+        decision = ta_client.get_decision(symbol, today)
+        action = decision.get("action", "HOLD")
+        journal.record(symbol, "decision", action=action)
+        print(f"Señal TA para {symbol}: {action}")
+
+    current_pos = ib_client.get_position(symbol)
+    print(f"Posición actual en {symbol}: {current_pos} acciones")
+
+    # 3) Salidas primero (SELL)
+    if action == "SELL":
+        if current_pos <= 0:
+            print("No hay posición que cerrar en este símbolo.")
+        else:
+            print(f"TA indica SELL y tienes {current_pos} acciones: cierro swing.")
+            if EXECUTE_ORDERS:
+                acked = submit_order_once(ib_client, journal, symbol, "SELL", current_pos)
+                portfolio["num_open_trades"] = max(0, portfolio["num_open_trades"] - 1)
+                return acked
+            print(f"[SIMULACIÓN] SELL {current_pos} {symbol}")
+        return True
+
+    # 4) Entrada (BUY)
+    if action == "BUY":
+        # Swing: no piramidar, solo una posición por símbolo
+        if current_pos > 0:
+            print("Ya hay posición abierta en este símbolo, no abro otra (swing).")
+            return True
+
+        # Límite de nº de trades
+        if portfolio["num_open_trades"] >= MAX_OPEN_TRADES:
+            print("Límite de trades abiertos alcanzado (5), no abro nueva posición.")
+            return True
+
+        # Límite de riesgo total (aunque con 5*1% no se llega al 15%)
+        projected_risk_total = portfolio["risk_total"] + (RISK_PER_TRADE * equity)
+        if projected_risk_total > MAX_TOTAL_RISK * equity:
+            print("Abrir este trade superaría el 15% de riesgo total, no entro.")
+            return True
+
+        sizing = journal.get(symbol, "sizing")
+        if sizing is not None:
+            print(f"[RESUME] Sizing ya registrado para {symbol}, no recalculo.")
+        else:
+            sizing = compute_entry_size(symbol, ib_client, equity)
+            if sizing is None:
+                return True
+            journal.record(symbol, "sizing", **sizing)
+
+        qty = sizing["qty"]
+        last_price = sizing["last_price"]
+
+        print(f"Precio {symbol}:                 {last_price:.2f}")
+        print(f"Riesgo por trade (1%):          {sizing['risk_amount']:.2f}")
+        print(f"Riesgo por acción:              {sizing['risk_per_share']:.2f}")
+        print(f"Capital posición estimado:      {qty * last_price:.2f}")
+        print(f"Cantidad final a comprar:       {qty} acciones")
+
+        if EXECUTE_ORDERS:
+            acked = submit_order_once(ib_client, journal, symbol, "BUY", qty)
+            portfolio["num_open_trades"] += 1
+            portfolio["risk_total"] += sizing["risk_amount"]
+            return acked
+        print(f"[SIMULACIÓN] BUY {qty} {symbol}")
+        return True
+
+    # HOLD
+    print("TA indica HOLD → mantengo, no abro ni cierro nada.")
+    return True
+
+
 def main():
     today = dt_date.today().strftime("%Y-%m-%d")
     print(f"=== ORCHESTRATOR SWING {today} ===")
 
-    ta_client = TradingAgentsClient(debug=False)
+    # Diario de la pasada: si existe, se retoma donde se quedó.
+    # En simulación no hay órdenes que proteger: siempre se empieza de cero.
+    if EXECUTE_ORDERS:
+        journal = RunJournal(today)
+    else:
+        journal = RunJournal(f"{today}-sim", fresh=True)
+
+    if journal.run_complete:
+        print(f"La pasada de {today} ya está completada ({journal.path}).")
+        print("Para repetirla, borra ese fichero.")
+        return
+    if journal.is_resumed:
+        print(f"[RESUME] Retomando pasada interrumpida desde {journal.path}")
+
+    ta_client = TradingAgentsClient(debug=False, compaction=CONTEXT_COMPACTION)
     ib_client = IBKRClient()
 
     ib_client.connect()
@@ -180,6 +449,7 @@ def main():
         p for p in positions
         if p.get("qty", 0) != 0 and p.get("symbol") in symbols_set
     ]
+    open_symbols = {p["symbol"] for p in open_trades}
     num_open_trades = len(open_trades)
 
     # A día de hoy, dimensionamos cada trade a 1%,
@@ -192,118 +462,56 @@ def main():
     print(f"Riesgo máximo permitido: {MAX_TOTAL_RISK * 100:.2f}%")
     print("========================================================")
 
-    for symbol in SYMBOLS:
-        print(f"\n--- Gestionando {symbol} ---")
+    portfolio = {
+        "equity": equity,
+        "num_open_trades": num_open_trades,
+        "risk_total": risk_total,
+    }
 
-        # 2) Señal de TradingAgents
-        decision = ta_client.get_decision(symbol, today)
-        action = decision.get("action", "HOLD")
-        print(f"Señal TA para {symbol}: {action}")
+    # Símbolos con orden enviada pero sin confirmar: no se dan por terminados
+    pending_symbols = []
 
-        current_pos = ib_client.get_position(symbol)
-        print(f"Posición actual en {symbol}: {current_pos} acciones")
+    for symbol in SYMBOLS:
+        print(f"\n--- Gestionando {symbol} ---")
 
-        # 3) Salidas primero (SELL)
-        if action == "SELL":
-            if current_pos <= 0:
-                print("No hay posición que cerrar en este símbolo.")
-            else:
-                print(f"TA indica SELL y tienes {current_pos} acciones: cierro swing.")
-                if EXECUTE_ORDERS:
-                    print(f"[EJECUTANDO] SELL {current_pos} {symbol}")
-                    ib_client.send_market_order(symbol, "SELL", current_pos)
-                    num_open_trades = max(0, num_open_trades - 1)
-                else:
-                    print(f"[SIMULACIÓN] SELL {current_pos} {symbol}")
+        if journal.is_done(symbol):
+            print(f"[RESUME] {symbol} ya completado en esta pasada, lo salto.")
+            # Su orden puede seguir viva (p.ej. Submitted antes de apertura):
+            # cuenta para los límites aunque aún no salga en las posiciones
+            order = journal.get(symbol, "order")
+            if order is not None and order["status"] not in TERMINAL_ORDER_STATUSES:
+                side = journal.get(symbol, "order_sent")["side"]
+                adjust_counters_for_order(portfolio, side, symbol, open_symbols)
             continue
 
-        # 4) Entrada (BUY)
-        if action == "BUY":
-            # Swing: no piramidar, solo una posición por símbolo
-            if current_pos > 0:
-                print("Ya hay posición abierta en este símbolo, no abro otra (swing).")
-                continue
-
-            # Límite de nº de trades
-            if num_open_trades >= MAX_OPEN_TRADES:
-                print("Límite de trades abiertos alcanzado (5), no abro nueva posición.")
-                continue
-
-            # Límite de riesgo total (aunque con 5*1% no se llega al 15%)
-            projected_risk_total = risk_total + (RISK_PER_TRADE * equity)
-            if projected_risk_total > MAX_TOTAL_RISK * equity:
-                print("Abrir este trade superaría el 15% de riesgo total, no entro.")
-                continue
-
-            # Datos fundamentales / técnicos: market cap, histórico, volatilidad, setup
-            market_cap, hist = get_market_cap_and_history(symbol)
-            if market_cap is None:
-                print("No puedo obtener market cap, no opero este símbolo.")
-                continue
-
-            print(f"Market cap {symbol}: {market_cap / 1e9:.2f} B")
-
-            if market_cap < MIN_MARKET_CAP:
-                print("Market cap < 2B, descartado por criterio de cartera swing.")
-                continue
-
-            vol_annual = compute_volatility(hist)
-            setup = classify_setup(hist)
-
-            print(f"Volatilidad anual aprox: {vol_annual * 100:.1f}%"
-                  if vol_annual is not None else "No se pudo estimar volatilidad.")
-            print(f"Tipo de setup: {setup}")
-
-            stop_pct = choose_stop_pct(vol_annual, setup)
-            print(f"Stop porcentual estimado: {stop_pct * 100:.2f}%")
-
-            # Precio actual aproximado (por si los datos de IB están limitados)
-            last_price = ib_client.get_last_price_ibkr_only(symbol)
-
-            if last_price is None or last_price <= 0:
-                print("No tengo un precio válido para dimensionar, no opero.")
+        # Orden enviada antes del corte: reconciliar en vez de reenviar
+        existing = reconcile_order(ib_client, journal, symbol)
+        if existing is not None:
+            if existing["status"] in TERMINAL_ORDER_STATUSES:
+                print(f"[RESUME] La orden de {symbol} terminó como {existing['status']}, no la reenvío.")
+                journal.mark_done(symbol, reason=f"orden {existing['status']}")
                 continue
 
-            # Riesgo y tamaño
-            risk_amount = equity * RISK_PER_TRADE        # € de riesgo por trade
-            risk_per_share = last_price * stop_pct       # € de riesgo por acción
-            qty = floor(risk_amount / risk_per_share)    # nº acciones
-
-            if qty <= 0:
-                print("Qty calculada <= 0, no opero.")
-                continue
-
-            capital_pos = qty * last_price
-            max_capital_for_symbol = equity * MAX_POSITION_EXPOSURE
-
-            if capital_pos > max_capital_for_symbol:
-                # Recortar tamaño para respetar el 8% de la cartera
-                qty_cap_limit = floor(max_capital_for_symbol / last_price)
-                print(f"Capital para posición ({capital_pos:.2f}) supera 8% cartera.")
-                print(f"Ajusto qty de {qty} -> {qty_cap_limit} para respetar el 8%.")
-                qty = qty_cap_limit
-
-            if qty <= 0:
-                print("Tras aplicar límite de exposición (8%), qty <= 0. No entro.")
-                continue
-
-            print(f"Precio {symbol}:                 {last_price:.2f}")
-            print(f"Riesgo por trade (1%):          {risk_amount:.2f}")
-            print(f"Riesgo por acción:              {risk_per_share:.2f}")
-            print(f"Capital posición estimado:      {qty * last_price:.2f}")
-            print(f"Cantidad final a comprar:       {qty} acciones")
-
-            if EXECUTE_ORDERS:
-                print(f"[EJECUTANDO] BUY {qty} {symbol}")
-                ib_client.send_market_order(symbol, "BUY", qty)
-                num_open_trades += 1
-                risk_total += risk_amount
+            # Ajustar contadores si la orden aún no se refleja en las posiciones
+            adjust_counters_for_order(portfolio, existing["side"], symbol, open_symbols)
+            if existing["status"] in ACKED_ORDER_STATUSES:
+                journal.mark_done(symbol, reason="orden reconciliada")
             else:
-                print(f"[SIMULACIÓN] BUY {qty} {symbol}")
+                pending_symbols.append(symbol)
+            continue
 
+        if process_symbol(symbol, today, ta_client, ib_client, journal, portfolio):
+            journal.mark_done(symbol)
         else:
-            # HOLD
-            print("TA indica HOLD → mantengo, no abro ni cierro nada.")
+            pending_symbols.append(symbol)
+
+    record_pending_fills(ib_client, journal, SYMBOLS)
+
+    if pending_symbols:
+        print(f"\n[WARN] Órdenes sin confirmar por IBKR: {', '.join(pending_symbols)}. "
+              f"Relanza para reconciliarlas.")
+    else:
+        journal.mark_run_complete()
 
     ib_client.disconnect()
     print("\n=== Fin de pasada diaria swing ===")
@@ -0,0 +1,212 @@
+"""
+replay_compaction.py
+
+Evalúa la compactación de contexto sobre los estados grabados en eval_results/.
+
+Sin argumentos (offline, sin LLM):
+- Reconstruye, a partir de los turnos grabados, el estado que recibió cada
+  agente posterior (cada turno de bull/bear, research manager, cada turno
+  del debate de riesgo, risk manager) y suma los tokens aprox. de los campos
+  que ese agente mete en su prompt (NODE_READS), antes / después de compactar.
+  Es una estimación (~4 caracteres por token) y solo cuenta el contexto que
+  se compacta, no las instrucciones fijas de cada prompt.
+
+Con --rerun (requiere TradingAgents y OPENAI_API_KEY):
+- Para cada estado grabado, mete sus informes de analistas en un estado
+  inicial y ejecuta solo los agentes posteriores (researchers -> research
+  manager -> trader -> debate de riesgo -> risk manager), con compactación,
+  y compara la acción con la de final_trade_decision grabada.
+- Con --baseline los ejecuta también sin compactar sobre los mismos
+  informes, para separar el efecto de la compactación del ruido del LLM.
+- No se llama a propagate(), así que no se escribe nada en eval_results/.
+
+Uso:
+    python src\\replay_compaction.py
+    python src\\replay_compaction.py --rerun --baseline
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Añadimos la raíz del proyecto al sys.path para que 'src' se pueda importar
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.context_compaction import (
+    DEFAULT_COMPACTION,
+    NODE_READS,
+    REPORT_FIELDS,
+    compact_state,
+    split_turns,
+)
+
+EVAL_DIR = PROJECT_ROOT / "eval_results"
+
+_PROPOSAL_RE = re.compile(r"FINAL TRANSACTION PROPOSAL:\s*\**\s*(BUY|SELL|HOLD)", re.IGNORECASE)
+_ACTION_RE = re.compile(r"\b(BUY|SELL|HOLD)\b", re.IGNORECASE)
+
+
+def extract_action(text: str) -> Optional[str]:
+    """Acción (BUY/SELL/HOLD) de un texto de decisión de TradingAgents."""
+    if not text:
+        return None
+    match = _PROPOSAL_RE.search(text) or _ACTION_RE.search(text)
+    return match.group(1).upper() if match else None
+
+
+def load_logged_states(eval_dir: Path = EVAL_DIR) -> List[Tuple[str, str, Dict]]:
+    """
+    Carga en memoria (símbolo, fecha, estado) de cada full_states_log grabado.
+    Se lee todo de golpe, antes de cualquier re-ejecución.
+    """
+    states = []
+    for path in sorted(eval_dir.glob("*/TradingAgentsStrategy_logs/full_states_log_*.json")):
+        with path.open("r", encoding="utf-8") as f:
+            logs = json.load(f)
+        for date_str, state in logs.items():
+            symbol = state.get("company_of_interest") or path.parts[-3]
+            states.append((symbol, date_str, state))
+    return states
+
+
+def _history_before(turns: List[str], count: int) -> str:
+    """History tal como lo ve el agente tras 'count' turnos (TradingAgents
+    añade cada argumento como "\n" + argumento)."""
+    return "".join("\n" + t for t in turns[:count])
+
+
+def node_inputs(state: Dict) -> List[Tuple[str, Dict]]:
+    """
+    (rol, estado de entrada) de cada llamada a un agente posterior, en el
+    orden del grafo, reconstruidos a partir del estado final grabado.
+    """
+    reports = {field: state.get(field, "") for field in REPORT_FIELDS}
+    invest_turns = split_turns((state.get("investment_debate_state") or {}).get("history"))
+    risk_turns = split_turns((state.get("risk_debate_state") or {}).get("history"))
+
+    calls = []
+    for i in range(len(invest_turns)):
+        role = "bull_researcher" if i % 2 == 0 else "bear_researcher"
+        calls.append((role, {
+            **reports,
+            "investment_debate_state": {"history": _history_before(invest_turns, i)},
+        }))
+    calls.append(("research_manager", {
+        "investment_debate_state": {"history": _history_before(invest_turns, len(invest_turns))},
+    }))
+
+    risk_roles = ("risky_debator", "safe_debator", "neutral_debator")
+    for i in range(len(risk_turns)):
+        calls.append((risk_roles[i % 3], {
+            **reports,
+            "risk_debate_state": {"history": _history_before(risk_turns, i)},
+        }))
+    calls.append(("risk_manager", {
+        "risk_debate_state": {"history": _history_before(risk_turns, len(risk_turns))},
+    }))
+    return calls
+
+
+def report_token_savings(settings: Dict) -> None:
+    total_before = 0
+    total_after = 0
+
+    print(f"{'Símbolo':8} {'Fecha':10} {'Llamadas':>8} {'Antes':>8} {'Después':>8} {'Ahorro':>7}")
+    for symbol, date_str, state in load_logged_states():
+        calls = node_inputs(state)
+        before = 0
+        after = 0
+        for role, node_state in calls:
+            _, stats = compact_state(node_state, settings, reads=NODE_READS[role])
+            before += stats["tokens_before"]
+            after += stats["tokens_after"]
+        total_before += before
+        total_after += after
+        pct = (before - after) / before * 100 if before else 0.0
+        print(f"{symbol:8} {date_str:10} {len(calls):8d} {before:8d} {after:8d} {pct:6.1f}%")
+
+    if total_before:
+        pct = (total_before - total_after) / total_before * 100
+        print(f"\nTOTAL contexto de agentes posteriores: {total_before} -> {total_after} "
+              f"tokens aprox. (-{pct:.1f}%)")
+
+
+def rerun_decisions(settings: Dict, baseline: bool) -> None:
+    recorded_states = load_logged_states()
+    if not recorded_states:
+        print("No hay logs en eval_results.")
+        return
+
+    from src.ta_client import TradingAgentsClient, run_downstream_agents
+
+    # Solo se usan sus LLMs y memorias: el grafo completo no se ejecuta
+    client = TradingAgentsClient(debug=False)
+    graph = client.ta
+
+    runs = 0
+    changed = 0
+    baseline_changed = 0
+    total = {"calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+    for symbol, date_str, recorded_state in recorded_states:
+        initial = graph.propagator.create_initial_state(symbol, date_str)
+        for field in REPORT_FIELDS:
+            initial[field] = recorded_state.get(field, "")
+
+        recorded = extract_action(recorded_state.get("final_trade_decision", ""))
+        final = run_downstream_agents(graph, initial, compaction=settings, stats=total)
+        action = graph.process_signal(final["final_trade_decision"])
+        runs += 1
+        changed += action != recorded
+
+        line = f"{symbol:8} {date_str:10} grabada={recorded} compactada={action}"
+        if baseline:
+            base_final = run_downstream_agents(graph, initial)
+            base_action = graph.process_signal(base_final["final_trade_decision"])
+            baseline_changed += base_action != recorded
+            line += f" sin_compactar={base_action}"
+        print(line)
+
+    print(f"\nCambios de decisión con compactación: {changed}/{runs} ({changed / runs * 100:.1f}%)")
+    if baseline:
+        print(f"Cambios sin compactar (ruido LLM):    {baseline_changed}/{runs} "
+              f"({baseline_changed / runs * 100:.1f}%)")
+    if total["tokens_before"]:
+        pct = (total["tokens_before"] - total["tokens_after"]) / total["tokens_before"] * 100
+        print(f"Contexto compactado en la re-ejecución: {total['calls']} llamadas, "
+              f"{total['tokens_before']} -> {total['tokens_after']} tokens aprox. (-{pct:.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rerun", action="store_true",
+                        help="Re-ejecuta los agentes posteriores con compactación y compara decisiones.")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Con --rerun, ejecuta también sin compactar como referencia.")
+    parser.add_argument("--max-report-chars", type=int,
+                        default=DEFAULT_COMPACTION["max_report_chars"])
+    parser.add_argument("--keep-last-turns", type=int,
+                        default=DEFAULT_COMPACTION["keep_last_turns"])
+    parser.add_argument("--old-turn-chars", type=int,
+                        default=DEFAULT_COMPACTION["old_turn_chars"])
+    args = parser.parse_args()
+
+    settings = {
+        "max_report_chars": args.max_report_chars,
+        "keep_last_turns": args.keep_last_turns,
+        "old_turn_chars": args.old_turn_chars,
+    }
+
+    report_token_savings(settings)
+    if args.rerun:
+        print()
+        rerun_decisions(settings, baseline=args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+run_journal.py
+
+Diario (write-ahead log) de una pasada del orquestador.
+
+Cada pasada diaria tiene su propio fichero JSONL (runs/run_YYYY-MM-DD.jsonl)
+donde se va apuntando, por símbolo, cada etapa completada:
+
+- decision:   señal de TradingAgents ya obtenida.
+- sizing:     tamaño calculado para la entrada (qty, precio, stop...).
+- order_sent: intención de orden, se escribe ANTES de llamar a IBKR.
+- order:      orden aceptada por IBKR (order_id, estado).
+- fill:       ejecución acumulada (cantidad y precio medio). Llega por el
+              evento de fill de IBKR o al reconciliar la orden; si era parcial
+              se vuelve a apuntar al crecer (la última entrada manda).
+- done:       símbolo terminado en esta pasada (con la orden, si la hay,
+              confirmada o rechazada por IBKR).
+
+Al acabar todos los símbolos se apunta 'run_complete' para la pasada entera.
+
+Si el proceso se cae o se corta el gateway, al relanzar se lee el diario y
+se retoma cada símbolo en la primera etapa incompleta. Las órdenes llevan un
+orderRef determinista (fecha-símbolo-lado) para poder reconciliarlas contra
+IBKR en lugar de reenviarlas.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_JOURNAL_DIR = PROJECT_ROOT / "runs"
+
+STAGES = ("decision", "sizing", "order_sent", "order", "fill", "done")
+RUN_COMPLETE = "run_complete"
+
+
+class RunJournal:
+    def __init__(
+        self,
+        run_date: str,
+        journal_dir: Optional[Path] = None,
+        fresh: bool = False,
+    ) -> None:
+        """
+        fresh=True descarta el diario existente de esa fecha y empieza de cero.
+        """
+        self.run_date = run_date
+        self.journal_dir = Path(journal_dir or DEFAULT_JOURNAL_DIR)
+        self.path = self.journal_dir / f"run_{run_date}.jsonl"
+
+        if fresh and self.path.exists():
+            self.path.unlink()
+
+        # symbol -> {stage: data}
+        self._state: Dict[str, Dict[str, Dict]] = {}
+        self.run_complete = False
+        # Si la última línea quedó cortada, la siguiente escritura empieza en línea nueva
+        self._needs_newline = False
+        self._load()
+
+    # ------------------------
+    # Lectura / replay
+    # ------------------------
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+
+        text = self.path.read_text(encoding="utf-8")
+        self._needs_newline = bool(text) and not text.endswith("\n")
+
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Última línea a medio escribir si el proceso murió durante el write
+                print(f"[WARN] Línea {line_no} corrupta en {self.path.name}, la ignoro.")
+                continue
+            self._apply(entry)
+
+    def _apply(self, entry: Dict) -> None:
+        symbol = entry.get("symbol")
+        stage = entry.get("stage")
+        if stage == RUN_COMPLETE:
+            self.run_complete = True
+            return
+        if not symbol or stage not in STAGES:
+            return
+        self._state.setdefault(symbol, {})[stage] = entry.get("data", {})
+
+    @property
+    def is_resumed(self) -> bool:
+        """True si el diario tiene entradas de una pasada que no llegó al final."""
+        return bool(self._state) and not self.run_complete
+
+    def get(self, symbol: str, stage: str) -> Optional[Dict]:
+        return self._state.get(symbol, {}).get(stage)
+
+    def has(self, symbol: str, stage: str) -> bool:
+        return stage in self._state.get(symbol, {})
+
+    def is_done(self, symbol: str) -> bool:
+        return self.has(symbol, "done")
+
+    # ------------------------
+    # Escritura
+    # ------------------------
+    def record(self, symbol: str, stage: str, **data) -> None:
+        """
+        Apunta una etapa completada. Se hace flush + fsync antes de volver,
+        así que lo escrito sobrevive a un crash inmediatamente posterior.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Etapa desconocida: {stage}")
+        self._append({
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "symbol": symbol,
+            "stage": stage,
+            "data": data,
+        })
+
+    def mark_done(self, symbol: str, reason: str = "") -> None:
+        self.record(symbol, "done", reason=reason)
+
+    def mark_run_complete(self) -> None:
+        """Marca la pasada entera como terminada: relanzarla no hará nada."""
+        self._append({
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "stage": RUN_COMPLETE,
+        })
+
+    def _append(self, entry: Dict) -> None:
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            if self._needs_newline:
+                f.write("\n")
+                self._needs_newline = False
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._apply(entry)
+
+    # ------------------------
+    # Órdenes
+    # ------------------------
+    def order_ref(self, symbol: str, side: str) -> str:
+        """
+        orderRef determinista para la orden de este símbolo en esta pasada.
+        Es lo que se busca en IBKR para saber si la orden ya se envió.
+        """
+        return f"ta-{self.run_date}-{symbol.upper()}-{side.upper()}"
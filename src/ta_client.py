@@ -2,10 +2,16 @@
 ta_client.py
 
 Wrapper sencillo para interactuar con TradingAgents.
+
+Opcionalmente compacta el contexto (informes de analistas e historiales de
+debate) antes de pasarlo a los agentes posteriores, para reducir tokens y
+latencia por símbolo. Ver src/context_compaction.py.
 """
 
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
@@ -22,20 +28,160 @@ else:
     raise RuntimeError(f"No encuentro el repo TradingAgents en {TA_REPO}")
 # ------------------------------------------------
 
+import tradingagents.graph.setup as ta_graph_setup
 from tradingagents.graph.trading_graph import TradingAgentsGraph
 from tradingagents.default_config import DEFAULT_CONFIG
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.context_compaction import (
+    DEFAULT_COMPACTION,
+    NODE_READS,
+    compact_state,
+    restore_debate_histories,
+)
+
+
+# Agentes que meten informes / debate de etapas anteriores en su prompt:
+# factoría de TradingAgents -> clave de NODE_READS. El trader no está porque
+# su prompt solo usa investment_plan.
+DOWNSTREAM_AGENT_FACTORIES = {
+    "create_bull_researcher": "bull_researcher",
+    "create_bear_researcher": "bear_researcher",
+    "create_research_manager": "research_manager",
+    "create_risky_debator": "risky_debator",
+    "create_safe_debator": "safe_debator",
+    "create_neutral_debator": "neutral_debator",
+    "create_risk_manager": "risk_manager",
+}
+
+
+def _empty_stats() -> Dict:
+    return {"calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def with_compaction(node, role: str, settings: Dict, stats: Dict):
+    """
+    Envuelve un nodo de agente: su prompt se construye con los campos que lee
+    (NODE_READS[role]) compactados, y lo que devuelve se monta sobre el estado
+    original. Acumula en 'stats' los tokens de esos campos antes / después.
+    """
+    reads = NODE_READS[role]
+
+    def compacted_node(state, *node_args, **node_kwargs):
+        compacted, node_stats = compact_state(state, settings, reads=reads)
+        stats["calls"] += 1
+        stats["tokens_before"] += node_stats["tokens_before"]
+        stats["tokens_after"] += node_stats["tokens_after"]
+        result = node(compacted, *node_args, **node_kwargs)
+        # El prompt usa el contexto compactado; el estado guarda el debate completo
+        return restore_debate_histories(result, state, compacted)
+
+    return compacted_node
+
+
+@contextmanager
+def _compaction_hooks(settings: Dict, stats: Dict):
+    """
+    Mientras está activo, las factorías de agentes que usa GraphSetup
+    devuelven nodos envueltos con with_compaction().
+    Los nodos quedan capturados en el grafo, así que basta con activarlo
+    durante la construcción de TradingAgentsGraph.
+    """
+    originals = {}
+
+    def wrap_factory(factory, role):
+        def wrapped_factory(*args, **kwargs):
+            return with_compaction(factory(*args, **kwargs), role, settings, stats)
+
+        return wrapped_factory
+
+    for name, role in DOWNSTREAM_AGENT_FACTORIES.items():
+        factory = getattr(ta_graph_setup, name, None)
+        if factory is None:
+            print(f"[WARN] TradingAgents no tiene {name}, no compacto su contexto.")
+            continue
+        originals[name] = factory
+        setattr(ta_graph_setup, name, wrap_factory(factory, role))
+
+    try:
+        yield
+    finally:
+        for name, factory in originals.items():
+            setattr(ta_graph_setup, name, factory)
+
+
+def run_downstream_agents(
+    graph: TradingAgentsGraph,
+    state: Dict,
+    compaction: Optional[Dict] = None,
+    stats: Optional[Dict] = None,
+) -> Dict:
+    """
+    Ejecuta solo los agentes posteriores a los analistas (bull/bear ->
+    research manager -> trader -> debate de riesgo -> risk manager) sobre un
+    estado que ya trae los informes, en el mismo orden y nº de rondas que el
+    grafo. Sirve para evaluar la compactación con informes fijos (grabados)
+    sin volver a ejecutar los analistas. Devuelve el estado final.
+    """
+    settings = None if compaction is None else {**DEFAULT_COMPACTION, **compaction}
+    stats = stats if stats is not None else _empty_stats()
+
+    def make(factory_name: str, llm, memory=None, role: Optional[str] = None):
+        factory = getattr(ta_graph_setup, factory_name)
+        node = factory(llm, memory) if memory is not None else factory(llm)
+        if settings is not None and role is not None:
+            node = with_compaction(node, role, settings, stats)
+        return node
+
+    quick, deep = graph.quick_thinking_llm, graph.deep_thinking_llm
+    bull = make("create_bull_researcher", quick, graph.bull_memory, "bull_researcher")
+    bear = make("create_bear_researcher", quick, graph.bear_memory, "bear_researcher")
+    manager = make("create_research_manager", deep, graph.invest_judge_memory, "research_manager")
+    trader = make("create_trader", quick, graph.trader_memory)
+    risky = make("create_risky_debator", quick, role="risky_debator")
+    safe = make("create_safe_debator", quick, role="safe_debator")
+    neutral = make("create_neutral_debator", quick, role="neutral_debator")
+    judge = make("create_risk_manager", deep, graph.risk_manager_memory, "risk_manager")
+
+    state = dict(state)
+    for i in range(2 * graph.config["max_debate_rounds"]):
+        state.update((bull if i % 2 == 0 else bear)(state))
+    state.update(manager(state))
+    state.update(trader(state))
+    for i in range(3 * graph.config["max_risk_discuss_rounds"]):
+        state.update((risky, safe, neutral)[i % 3](state))
+    state.update(judge(state))
+    return state
+
 
 class TradingAgentsClient:
-    def __init__(self, config=None, debug=False):
+    def __init__(self, config=None, debug=False, compaction: Optional[Dict] = None):
+        """
+        compaction: None = sin compactar. Un dict (puede ser {}) activa la
+        compactación con DEFAULT_COMPACTION sobrescrito por sus claves.
+        """
         if config is None:
             config = DEFAULT_CONFIG.copy()
-        self.ta = TradingAgentsGraph(debug=debug, config=config)
+
+        self.compaction = None
+        self.compaction_stats = _empty_stats()
+
+        if compaction is None:
+            self.ta = TradingAgentsGraph(debug=debug, config=config)
+        else:
+            self.compaction = {**DEFAULT_COMPACTION, **compaction}
+            with _compaction_hooks(self.compaction, self.compaction_stats):
+                self.ta = TradingAgentsGraph(debug=debug, config=config)
 
     def get_decision(self, symbol: str, date_str: str) -> dict:
         """
         Llama a TradingAgents y devuelve SIEMPRE un dict con al menos 'action'.
         """
+        # Los nodos comparten este dict: se resetea in situ en cada propagación
+        self.compaction_stats.update(_empty_stats())
+
         state, raw_decision = self.ta.propagate(symbol, date_str)
 
         # Normalizar el tipo de decisión
@@ -52,4 +198,12 @@ class TradingAgentsClient:
         print(">>> RAW_DECISION TradingAgents:", raw_decision)
         print(">>> DECISION normalizada:", decision)
 
+        if self.compaction is not None:
+            stats = self.compaction_stats
+            saved = stats["tokens_before"] - stats["tokens_after"]
+            pct = saved / stats["tokens_before"] * 100 if stats["tokens_before"] else 0.0
+            print(f">>> COMPACTACIÓN contexto: {stats['calls']} llamadas, "
+                  f"{stats['tokens_before']} -> {stats['tokens_after']} tokens aprox. "
+                  f"(-{saved}, {pct:.1f}%)")
+
         return decision